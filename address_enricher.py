@@ -1,50 +1,117 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import os, re, csv, time, argparse, requests
+import os, re, sys, csv, json, time, marshal, sqlite3, argparse, threading, unicodedata, requests
 import pandas as pd
-from difflib import get_close_matches
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache, partial
+from rapidfuzz import fuzz, process
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit
 
 # ---------------- Utilities ----------------
+REPLACEMENTS = {
+    "dacca": "dhaka", "chittagong": "chattogram", "ctg": "chattogram",
+    "barisal": "barishal", "cumilla": "comilla", "uttora": "uttara",
+    "gulshan-1": "gulshan 1", "gulshan-2": "gulshan 2",
+    "badda thana": "badda", "banani thana": "banani",
+    "kotowali": "kotwali", "mohammad pur": "mohammadpur",
+}
+BANGLA_REPLACEMENTS = {
+    "ঢাকা":"Dhaka","চট্টগ্রাম":"Chattogram","কমিল্লা":"Comilla","কুমিল্লা":"Comilla",
+    "বগুড়া":"Bogura","নরসিংদী":"Narsingdi","নরায়ণগঞ্জ":"Narayanganj",
+    "সিলেট":"Sylhet","খুলনা":"Khulna","বরিশাল":"Barishal","রাজশাহী":"Rajshahi",
+    "কিশোরগঞ্জ":"Kishoreganj","দিনাজপুর":"Dinajpur","ফেনী":"Feni","নোয়াখালী":"Noakhali",
+    "লক্ষ্মীপুর":"Lakshmipur","শ্যামলী":"Shyamoli","গুলশান":"Gulshan","বানানী":"Banani",
+    "উত্তরা":"Uttara","বাড্ডা":"Badda","মতিঝিল":"Motijheel","শাহবাগ":"Shahbag",
+}
+
+def _trie_pattern(words):
+    """Regex source for ``words`` with shared prefixes factored into a trie.
+
+    A flat ``a|b|c`` alternation retries every branch at each position; the
+    trie form follows one path per character, the stdlib-``re`` equivalent of
+    an Aho-Corasick automaton. Extensions are tried before stopping, so the
+    longest key wins at a given position (e.g. "gulshan-1" over "gulshan").
+    """
+    trie = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node):
+        alts = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+def _alternation(words):
+    return re.compile(_trie_pattern(words))
+
+# one pass over the string instead of one str.replace() per table entry
+_REPL_RE = _alternation(REPLACEMENTS)
+_BN_RE = _alternation(BANGLA_REPLACEMENTS)
+_REPL_FN = lambda m: REPLACEMENTS[m.group(0)]
+_BN_FN = lambda m: BANGLA_REPLACEMENTS[m.group(0)]
+_CLEAN = re.compile(r"[^a-z0-9,/\-\s]+")
+_WS = re.compile(r"\s+")
+# digits spelled out: pandas runs .str.fullmatch through RE2, where \d is ASCII-only
+NUMERIC_ONLY = re.compile(r"[0-9০-৯]+(?:[/.,-][0-9০-৯]+)*")  # always used with fullmatch
+_HAS_LETTER = re.compile(r"[a-z]")
+# byte table doing _CLEAN's job for ASCII input; whitespace maps to b" " too and split() collapses it
+_KEEP = frozenset(b"abcdefghijklmnopqrstuvwxyz0123456789,/-")
+_ASCII_CLEAN = bytes(b if b in _KEEP else 0x20 for b in range(256))
+
+@lru_cache(maxsize=16384)
 def normalize(s: str) -> str:
     if not isinstance(s, str):
         s = "" if s is None else str(s)
-    s = s.lower()
-    replacements = {
-        "dacca": "dhaka", "chittagong": "chattogram", "ctg": "chattogram",
-        "barisal": "barishal", "cumilla": "comilla", "uttora": "uttara",
-        "gulshan-1": "gulshan 1", "gulshan-2": "gulshan 2",
-        "badda thana": "badda", "banani thana": "banani",
-        "kotowali": "kotwali", "mohammad pur": "mohammadpur",
-    }
-    for a, b in replacements.items():
-        s = s.replace(a, b)
-    s = re.sub(r"[^a-z0-9,/\-\s]", " ", s)
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
+    s = _REPL_RE.sub(_REPL_FN, s.lower())
+    if s.isascii():
+        # the common case: one C-level translate + split instead of two regex passes
+        return b" ".join(s.encode("ascii").translate(_ASCII_CLEAN).split()).decode("ascii")
+    s = _CLEAN.sub(" ", s)
+    return _WS.sub(" ", s).strip()
+
+def normalize_series(s: pd.Series) -> pd.Series:
+    """Vectorized :func:`normalize` for a whole column (missing values become "").
+
+    Matches the scalar version except for a few exotic case mappings (e.g. the
+    Turkish dotted capital I), which Arrow's lowercase kernel folds differently.
+    """
+    s = s.fillna("").astype(str).str.lower()
+    # chained literal passes give the same result as the single-pass regex above, but
+    # each one runs as a native string kernel instead of a Python callback per match
+    for a, b in REPLACEMENTS.items():
+        s = s.str.replace(a, b, regex=False)
+    s = s.str.replace(_CLEAN.pattern, " ", regex=True)
+    return s.str.replace(_WS.pattern, " ", regex=True).str.strip()
 
+@lru_cache(maxsize=16384)
 def bangla_normalize_text(s: str) -> str:
     if not isinstance(s, str):
         return ""
-    rep = {
-        "ঢাকা":"Dhaka","চট্টগ্রাম":"Chattogram","কমিল্লা":"Comilla","কুমিল্লা":"Comilla",
-        "বগুড়া":"Bogura","নরসিংদী":"Narsingdi","নরায়ণগঞ্জ":"Narayanganj",
-        "সিলেট":"Sylhet","খুলনা":"Khulna","বরিশাল":"Barishal","রাজশাহী":"Rajshahi",
-        "কিশোরগঞ্জ":"Kishoreganj","দিনাজপুর":"Dinajpur","ফেনী":"Feni","নোয়াখালী":"Noakhali",
-        "লক্ষ্মীপুর":"Lakshmipur","শ্যামলী":"Shyamoli","গুলশান":"Gulshan","বানানী":"Banani",
-        "উত্তরা":"Uttara","বাড্ডা":"Badda","মতিঝিল":"Motijheel","শাহবাগ":"Shahbag",
-    }
-    for a, b in rep.items():
-        s = s.replace(a, b)
-    return s
+    if not s.isascii():
+        # the table is in NFC, where nukta letters are decomposed (ড় = ড + ়); typed
+        # text often uses the precomposed code points and would otherwise never match
+        s = unicodedata.normalize("NFC", s)
+    return _BN_RE.sub(_BN_FN, s)
 
+CANONICAL_NAMES = {"Chittagong": "Chattogram","Jessore": "Jashore","Barisal": "Barishal",
+                   "Cumilla": "Comilla","Bogra": "Bogura","Cox'S Bazar":"Cox S Bazar","Cox's Bazar": "Cox S Bazar"}
+
+@lru_cache(maxsize=4096)  # few distinct names, asked for on every row
 def to_english(s: str | None) -> str:
     if not s or str(s).strip().lower() == "not found":
         return "Not found"
     txt = bangla_normalize_text(str(s).strip())
-    canon = {"Chittagong": "Chattogram","Jessore": "Jashore","Barisal": "Barishal",
-             "Cumilla": "Comilla","Bogra": "Bogura","Cox'S Bazar":"Cox S Bazar","Cox's Bazar": "Cox S Bazar"}
-    txt = canon.get(txt, txt)
+    txt = CANONICAL_NAMES.get(txt, txt)
     return txt.title()
 
 # ---------------- Data seeds ----------------
@@ -87,56 +154,141 @@ def _expand(area_to_district):
     out = {}
     for k, v in area_to_district.items():
         for variant in {k, k.replace("-", " "), k.replace(" ", ""), k.replace("/", " ")}:
-            out[normalize(variant)] = v
+            out[sys.intern(normalize(variant))] = sys.intern(v)
     return out
 EXPANDED_AREA = _expand(AREA_TO_DISTRICT)
-AREA_KEYS = list(set(EXPANDED_AREA.keys()))
-DISTRICT_KEYS = list(set([normalize(d) for d in DISTRICTS] + list(DISTRICT_ALIASES.keys())))
+# the vocabulary is fixed, so intern it: lookups with interned tokens compare by identity
+AREA_KEYS = sorted(set(EXPANDED_AREA.keys()))
+NORM_DISTRICTS = tuple(sys.intern(normalize(d)) for d in DISTRICTS)
+DISTRICT_KEYS = sorted(set(NORM_DISTRICTS) | {sys.intern(a) for a in DISTRICT_ALIASES})
+
+def _word_alternation(words):
+    # the leading class lets the scan skip positions no key can start at before
+    # paying for the \b check and the trie
+    first = "".join(sorted({re.escape(w[0]) for w in words if w}))
+    return re.compile(rf"(?=[{first}])\b(" + _alternation(words).pattern + r")\b")
+
+# display form of every area key, so the "r a" -> "R/A" fixup and title-casing
+# happen once at import rather than for every address
+AREA_LABELS = {k: to_english(k.replace(" r a", " R/A")) for k in AREA_KEYS}
+
+# a single search per address instead of one re.search() per key
+_AREA_RE = _word_alternation(AREA_KEYS)
+_DISTRICT_RE = _word_alternation(DISTRICT_KEYS)
 
 # ---------------- Guessers (offline) ----------------
+@lru_cache(maxsize=16384)
+def _scan_tokens(addr_norm: str) -> tuple[tuple[str, ...], tuple[str, ...]]:
+    """Tokens and all grams (tokens, then bigrams) of a normalized address, computed once."""
+    toks = tuple(map(sys.intern, addr_norm.replace(",", " ").split()))
+    return toks, toks + tuple(f"{a} {b}" for a, b in zip(toks, toks[1:]))
+
+def _reachable_lengths(choices, cutoff):
+    """Query lengths that could score >= ``cutoff`` against some choice.
+
+    ``fuzz.ratio`` is at most ``200 * min(a, b) / (a + b)``, so e.g. house
+    numbers and two-letter tokens never get near a 90 against area names.
+    """
+    lens = {len(c) for c in choices}
+    return frozenset(n for n in range(1, 2 * max(lens, default=0) + 1)
+                     if any(200 * min(n, m) >= cutoff * (n + m) for m in lens))
+
+def _first_fuzzy(queries, choices, cutoff, lengths):
+    """Best choice for the first query that has one scoring >= ``cutoff``.
+
+    Same answer as calling ``process.extractOne`` per query in order, but
+    queries of a hopeless length are dropped and the rest are scored in a
+    single ``cdist`` call.
+    """
+    queries = [q for q in queries if len(q) in lengths]
+    if not queries:
+        return None
+    scores = process.cdist(queries, choices, scorer=fuzz.ratio, score_cutoff=cutoff)
+    hit = scores.any(axis=1).nonzero()[0]
+    return choices[int(scores[hit[0]].argmax())] if len(hit) else None
+
+_AREA_LENGTHS = _reachable_lengths(AREA_KEYS, 90)
+_DISTRICT_LENGTHS = _reachable_lengths(NORM_DISTRICTS, 88)
+
+@lru_cache(maxsize=16384)
 def guess_area(addr_norm: str) -> str | None:
-    for a in AREA_KEYS:
-        if re.search(rf"\b{re.escape(a)}\b", addr_norm):
-            return a
-    toks = addr_norm.replace(",", " ").split()
-    grams = toks + [" ".join(toks[i:i+2]) for i in range(len(toks)-1)]
-    for g in grams:
-        g = normalize(g)
-        m = get_close_matches(g, AREA_KEYS, n=1, cutoff=0.9)
-        if m:
-            return m[0]
-    return None
+    m = _AREA_RE.search(addr_norm)
+    if m:
+        return m.group(1)
+    return _first_fuzzy(_scan_tokens(addr_norm)[1], AREA_KEYS, 90, _AREA_LENGTHS)
+
+@lru_cache(maxsize=16384)
+def classify(addr_norm: str) -> tuple[str | None, str | None]:
+    """(district, area) for a normalized address.
+
+    The area match doubles as the district fallback, so it is resolved once
+    here instead of separately by each guesser.
+    """
+    area = guess_area(addr_norm)
+    m = _DISTRICT_RE.search(addr_norm)
+    if m:
+        return DISTRICT_ALIASES.get(m.group(1), m.group(1)), area
+    if area:
+        return EXPANDED_AREA.get(area), area
+    return _first_fuzzy(_scan_tokens(addr_norm)[0], NORM_DISTRICTS, 88, _DISTRICT_LENGTHS), area
 
 def guess_district_from_text(addr_norm: str) -> str | None:
-    for d in DISTRICT_KEYS:
-        if re.search(rf"\b{re.escape(d)}\b", addr_norm):
-            return DISTRICT_ALIASES.get(d, d)
-    a = guess_area(addr_norm)
-    if a:
-        return EXPANDED_AREA.get(a)
-    tokens = addr_norm.replace(",", " ").split()
-    for t in tokens:
-        m = get_close_matches(t, [normalize(x) for x in DISTRICTS], n=1, cutoff=0.88)
-        if m:
-            return m[0]
-    return None
+    return classify(addr_norm)[0]
 
 # ---------------- Gazetteer (UTF-8 SAFE) ----------------
+# bump whenever _parse_csv_gazetteer or normalize() changes what a row becomes,
+# so sidecars written by older code are rebuilt instead of trusted
+GAZETTEER_FORMAT = 2
+
 def load_csv_gazetteer(path: str):
-    rows = []
     if not path or not os.path.exists(path):
-        return rows
+        return []
+    info = os.stat(path)
+    return list(_cached_gazetteer(os.path.abspath(path), info.st_mtime_ns, info.st_size))
+
+@lru_cache(maxsize=4)
+def _cached_gazetteer(path: str, mtime_ns: int, size: int):
+    """Parsed rows for one version of a gazetteer CSV.
+
+    Keyed on mtime and size so an edited file is re-read. A ``.marshal`` sidecar
+    skips parsing and normalization in later processes too; it records the CSV's
+    ``(mtime_ns, size)`` and :data:`GAZETTEER_FORMAT` and is rebuilt on any mismatch.
+    marshal only decodes plain values (no code runs on load), and a sidecar that
+    fails to load for any reason is treated as a miss.
+    """
+    sidecar = path + ".marshal"
+    stamp = (GAZETTEER_FORMAT, mtime_ns, size)
+    try:
+        with open(sidecar, "rb") as f:
+            saved_stamp, rows = marshal.load(f)
+        if saved_stamp == stamp:
+            return rows
+    except Exception:
+        pass
+    rows = tuple(_parse_csv_gazetteer(path))
+    try:
+        tmp = f"{sidecar}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            marshal.dump((stamp, rows), f)
+        os.replace(tmp, sidecar)
+    except OSError:
+        pass  # read-only location; the in-process cache still applies
+    return rows
+
+def _parse_csv_gazetteer(path: str):
+    rows = []
     for enc in ("utf-8", "utf-8-sig"):
         try:
-            df = pd.read_csv(path, encoding=enc, engine="python", on_bad_lines="skip")
+            df = pd.read_csv(path, encoding=enc, dtype=str, on_bad_lines="skip")
             cols = {c.lower(): c for c in df.columns}
             th_col = cols.get("thana") or cols.get("upazila") or cols.get("area") or list(df.columns)[0]
             di_col = cols.get("district") or list(df.columns)[1]
-            numeric = re.compile(r"^\s*\d+([/.,-]\d+)*\s*$")
-            for _, r in df[[th_col, di_col]].dropna().iterrows():
-                th_raw = str(r[th_col]).strip()
-                di_raw = str(r[di_col]).strip()
-                if numeric.fullmatch(th_raw) or numeric.fullmatch(di_raw):
+            part = df[[th_col, di_col]].dropna()
+            # plain lists instead of iterrows: no Series built per row
+            for th_raw, di_raw in zip(part[th_col].tolist(), part[di_col].tolist()):
+                th_raw = str(th_raw).strip()
+                di_raw = str(di_raw).strip()
+                if NUMERIC_ONLY.fullmatch(th_raw) or NUMERIC_ONLY.fullmatch(di_raw):
                     continue
                 th = normalize(th_raw)
                 di = normalize(di_raw)
@@ -150,136 +302,503 @@ def load_csv_gazetteer(path: str):
 def make_offline_index(csv_rows):
     m = dict(EXPANDED_AREA)
     for th, di in csv_rows:
-        m[th] = di
+        # a few dozen district names repeat across hundreds of rows; share one object each
+        m[sys.intern(th)] = sys.intern(di)
     return m
 
+# a small hand-picked district -> thanas seed, for users without a gazetteer CSV
+STARTER_GAZETTEER = {
+    "Dhaka": ["Gulshan","Banani","Badda","Uttara","Khilkhet","Mohammadpur","Tejgaon","Dhanmondi",
+              "Rampura","Jatrabari","Wari","Motijheel","Kafrul","Cantonment","Baridhara",
+              "Bashundhara R/A","Bosila","Khilgaon"],
+    "Gazipur": ["Tongi","Joydebpur","Kaliakair","Kaliganj","Sreepur"],
+    "Narayanganj": ["Sadar","Sonargaon","Rupganj","Araihazar","Siddhirganj","Bandar","Fatulla"],
+    "Chattogram": ["Kotwali","Pahartali","Double Mooring","Halishahar","Patenga","Bakalia",
+                   "Panchlaish","Chandgaon","Bayazid","Akbar Shah"],
+    "Sylhet": ["Subidbazar","South Surma","Kotwali Sylhet","Moglabazar","Ambarkhana","Osmani Nagar","Beanibazar"],
+    "Comilla": ["Adarsa Sadar","Kotwali Comilla","Daudkandi","Chandina","Homna","Burichang"],
+    "Khulna": ["Sonadanga","Daulatpur","Khalishpur","Khulna Kotwali","Rupsha"],
+    "Rajshahi": ["Boalia","Rajpara","Motihar","Shah Makhdum","Paba"],
+    "Barishal": ["Barishal Kotwali","Bakerganj","Banaripara","Gournadi"],
+    "Mymensingh": ["Sadar","Trishal","Ishwarganj","Muktagacha"],
+    "Rangpur": ["Gangachara","Pirganj","Kaunia","Mithapukur"],
+    "Noakhali": ["Sadar","Begumganj","Senbagh","Chatkhil"],
+    "Feni": ["Sadar","Sonagazi","Chhagalnaiya","Parshuram"],
+    "Bogura": ["Sadar","Sherpur","Gabtali","Shajahanpur"],
+    "Kushtia": ["Sadar","Mirpur","Bheramara","Khoksa"],
+}
+
+@lru_cache(maxsize=1)
+def starter_gazetteer() -> pd.DataFrame:
+    """:data:`STARTER_GAZETTEER` as a sorted ``thana,district`` frame, built once per process."""
+    thanas, districts = [], []
+    for d, ts in STARTER_GAZETTEER.items():
+        thanas.extend(ts)
+        districts.extend([d] * len(ts))
+    df = pd.DataFrame({"thana": thanas, "district": districts})
+    return df.sort_values(["district","thana"]).reset_index(drop=True)
+
+def drop_invalid_pairs(part: pd.DataFrame) -> pd.DataFrame:
+    """Drop ``thana``/``district`` rows where either name is blank, numeric-only or "Not found".
+
+    Names are expected already stripped, as :func:`clean_gazetteer_frame` leaves them.
+    """
+    keep = True
+    for col in ("thana", "district"):
+        v = part[col]
+        # plain bool arrays: no intermediate Series or index alignment per "&"
+        keep = (keep & (v != "").to_numpy()
+                & ~v.str.fullmatch(NUMERIC_ONLY).to_numpy(dtype=bool, na_value=False)
+                & (v.str.lower() != "not found").to_numpy())
+    return part[keep]
+
+def clean_gazetteer_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Title-cased, filtered ``thana,district`` pairs from any gazetteer-like frame."""
+    cols = {c.lower(): c for c in df.columns}
+    th = cols.get("thana") or cols.get("upazila") or cols.get("area") or list(df.columns)[0]
+    di = cols.get("district") or list(df.columns)[1]
+    part = df[[th, di]].rename(columns={th: "thana", di: "district"})
+    part["thana"] = part["thana"].astype(str).str.strip()
+    part["district"] = part["district"].astype(str).str.strip()
+    # filter first (the checks are case-insensitive), so only kept rows pay for title-casing
+    part = drop_invalid_pairs(part)
+    return part.assign(thana=part["thana"].str.title(), district=part["district"].str.title())
+
 # ---------------- Cache ----------------
+NEGATIVE_TTL = 7 * 24 * 3600  # seconds before a "Not found" answer is looked up again
+
+def _status(d, t):
+    return "notfound" if d == "Not found" and t == "Not found" else "ok"
+
+class GeocodeCache:
+    """Online lookups persisted in SQLite, written through on every store.
+
+    Behaves like the plain dict it replaces (``in``, ``[]``, ``items()``), so
+    startup no longer parses the whole cache and a crash keeps what was fetched.
+    A small LRU sits in front so repeated addresses don't hit SQLite.
+
+    Answers where nothing was found expire after ``negative_ttl`` seconds and
+    read as misses, so a transient Nominatim failure doesn't stick forever.
+    Successful answers only go away through :meth:`invalidate_prefix`.
+    """
+    def __init__(self, path, hot_size=4096, negative_ttl=NEGATIVE_TTL):
+        self.path = path
+        self.negative_ttl = negative_ttl
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS cache "
+                          "(address TEXT PRIMARY KEY, district TEXT, thana TEXT, "
+                          "fetched_at REAL, status TEXT)")
+        have = {r[1] for r in self.conn.execute("PRAGMA table_info(cache)")}
+        for col, typ in (("fetched_at", "REAL"), ("status", "TEXT")):
+            if col not in have:  # caches created before the TTL columns existed
+                self.conn.execute(f"ALTER TABLE cache ADD COLUMN {col} {typ}")
+        self._lock = threading.Lock()
+        self._hot = OrderedDict()  # address -> (district, thana, expires_at)
+        self._hot_size = hot_size
+
+    def _remember(self, address, d, t, fetched_at, status):
+        status = status or _status(d, t)  # imported/legacy rows carry no status
+        expires = float("inf") if status == "ok" else (fetched_at or 0) + self.negative_ttl
+        self._hot[address] = (d, t, expires)
+        self._hot.move_to_end(address)
+        if len(self._hot) > self._hot_size:
+            self._hot.popitem(last=False)
+
+    def get(self, address, default=None):
+        with self._lock:
+            hit = self._hot.get(address)
+            if hit is None:
+                row = self.conn.execute("SELECT district, thana, fetched_at, status FROM cache "
+                                        "WHERE address=?", (address,)).fetchone()
+                if row is None:
+                    return default
+                self._remember(address, *row)
+                hit = self._hot[address]
+            else:
+                self._hot.move_to_end(address)
+        d, t, expires = hit
+        return (d, t) if time.time() < expires else default
+
+    def __contains__(self, address):
+        return self.get(address) is not None
+
+    def __getitem__(self, address):
+        v = self.get(address)
+        if v is None:
+            raise KeyError(address)
+        return v
+
+    def __setitem__(self, address, value):
+        d, t = value
+        now, status = time.time(), _status(d, t)
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+                              (address, d, t, now, status))
+            self._remember(address, d, t, now, status)
+
+    def items(self):
+        with self._lock:
+            rows = self.conn.execute("SELECT address, district, thana FROM cache").fetchall()
+        return [(a, (d, t)) for a, d, t in rows]
+
+    def invalidate_prefix(self, prefix):
+        """Drop every entry whose address starts with ``prefix``; returns the count."""
+        with self._lock:
+            n = self.conn.execute("DELETE FROM cache WHERE substr(address, 1, length(?)) = ?",
+                                  (prefix, prefix)).rowcount
+            self._hot.clear()
+        return n
+
+    def import_csv(self, csv_path):
+        with open(csv_path, newline="", encoding="utf-8", errors="ignore") as f:
+            rows = [(r["address"], r["district"], r["thana"]) for r in csv.DictReader(f)]
+        with self._lock:
+            self.conn.execute("BEGIN")
+            # no fetch time is known for these, so their "Not found" rows are already stale
+            self.conn.executemany("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, NULL, NULL)", rows)
+            self.conn.execute("COMMIT")
+            self._hot.clear()
+
+    def close(self):
+        self.conn.close()
+
+def resolve_cache_path(cache_path):
+    """``cache_path``, or its legacy ``.csv`` sibling if the ``.db`` doesn't exist yet.
+
+    Earlier versions kept the cache in ``cache_geocode.csv``; pointing at the new
+    ``.db`` default must not silently ignore those lookups.
+    """
+    if cache_path.lower().endswith(".db") and not os.path.exists(cache_path):
+        legacy = os.path.splitext(cache_path)[0] + ".csv"
+        if os.path.exists(legacy):
+            return legacy
+    return cache_path
+
 def load_cache(cache_path):
-    cache = {}
-    if cache_path and os.path.exists(cache_path):
-        with open(cache_path, newline="", encoding="utf-8", errors="ignore") as f:
-            r = csv.DictReader(f)
-            for row in r:
-                cache[row["address"]] = (row["district"], row["thana"])
-    return cache
-
-def save_cache(cache_path, cache_dict):
-    if not cache_path:
-        return
-    with open(cache_path, "w", newline="", encoding="utf-8") as f:
-        w = csv.writer(f)
-        w.writerow(["address", "district", "thana"])
-        for k, (d, t) in cache_dict.items():
-            w.writerow([k, d, t])
+    """Open the geocode cache at ``cache_path``.
+
+    A legacy ``.csv`` cache is imported into a ``.db`` file next to it whenever
+    the CSV is newer than the database, e.g. after a fresh upload in the app, or
+    when a ``.db`` that doesn't exist yet has a ``.csv`` sibling.
+    """
+    cache_path = resolve_cache_path(cache_path)
+    if cache_path.lower().endswith(".csv"):
+        db_path = os.path.splitext(cache_path)[0] + ".db"
+        stale = os.path.exists(cache_path) and (
+            not os.path.exists(db_path) or os.path.getmtime(cache_path) > os.path.getmtime(db_path))
+        cache = GeocodeCache(db_path)
+        if stale:
+            cache.import_csv(cache_path)
+        return cache
+    return GeocodeCache(cache_path)
+
+def read_cache_pairs(cache_path, chunksize: int = 100_000):
+    """Distinct ``district,thana`` pairs of a cache, without loading every address.
+
+    A CSV cache is read in chunks of its two name columns, deduplicated as it goes;
+    a SQLite cache lets ``SELECT DISTINCT`` do the work.
+    """
+    if cache_path.lower().endswith(".csv"):
+        head = pd.read_csv(cache_path, encoding="utf-8", nrows=0)
+        cols = [c for c in head.columns if c.lower() in ("district", "thana")]
+        if len(cols) < 2:
+            return head
+        frames = [chunk.drop_duplicates() for chunk in
+                  pd.read_csv(cache_path, encoding="utf-8", dtype=str, usecols=cols, chunksize=chunksize)]
+        if not frames:
+            return head[cols]
+        return pd.concat(frames, ignore_index=True).drop_duplicates(ignore_index=True)
+    cache = GeocodeCache(cache_path)
+    try:
+        return pd.read_sql_query("SELECT DISTINCT district, thana FROM cache", cache.conn)
+    finally:
+        cache.close()
 
 # ---------------- Online (OSM) ----------------
-def nominatim_lookup(address):
-    base = "https://nominatim.openstreetmap.org/search"
-    headers = {
-        "User-Agent": "BD-Address-Enricher/1.1 (educational; contact: youremail@example.com)",
-        "Accept-Language": "en"
-    }
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
+NOMINATIM_INTERVAL = 1.1  # seconds between requests, shared by all workers (OSM policy)
+ENDPOINT_TYPES = ("public", "self-hosted", "photon")
+BD_BBOX = "88.0,20.6,92.7,26.7"  # lon/lat box used to keep Photon results in Bangladesh
+
+def check_endpoint(url, endpoint_type):
+    """Raise ValueError for a non-``public`` endpoint type aimed at the public OSM server.
+
+    Those types drop the throttle and widen the pool, which the OSM policy forbids,
+    and ``photon`` would parse Nominatim's JSON with the wrong schema.
+    """
+    if endpoint_type != "public" and urlsplit(url).hostname == urlsplit(NOMINATIM_URL).hostname:
+        raise ValueError(f"endpoint type {endpoint_type!r} needs your own server URL, "
+                         f"not the public {NOMINATIM_URL}")
+
+# one keep-alive session so lookups don't pay a TCP+TLS handshake each
+SESSION = requests.Session()
+SESSION.headers.update({
+    "User-Agent": "BD-Address-Enricher/1.1 (educational; contact: youremail@example.com)",
+    "Accept-Language": "en"
+})
+# at least as many pooled connections as run() starts workers, so none are dropped
+POOL_SIZE = max(8, os.cpu_count() or 1)
+SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE))
+SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE))  # local endpoints
+
+_rate_lock = threading.Lock()
+_next_allowed_ts = 0.0
+
+def _throttle(interval=NOMINATIM_INTERVAL):
+    """Block until the global request interval (or a pending backoff) has elapsed (thread-safe)."""
+    global _next_allowed_ts
+    with _rate_lock:
+        now = time.monotonic()
+        wait = _next_allowed_ts - now
+        if interval > 0:
+            _next_allowed_ts = max(now, _next_allowed_ts) + interval
+    if wait > 0:
+        time.sleep(wait)
+
+RETRY_STATUS = frozenset({429, 502, 503, 504})
+MAX_RETRIES = 3
+BACKOFF_BASE = 2.0  # retry n waits BACKOFF_BASE ** n seconds (1, 2, 4) unless Retry-After says otherwise
+
+class GeocoderUnavailable(RuntimeError):
+    """The endpoint kept refusing or couldn't be reached, even after backing off.
+
+    Distinct from "no match": nothing should be cached for the address.
+    """
+
+def _backoff(delay):
+    """Push the shared schedule back so every worker pauses, not only the one refused."""
+    global _next_allowed_ts
+    with _rate_lock:
+        _next_allowed_ts = max(_next_allowed_ts, time.monotonic() + delay)
+
+def _fetch(url, params, interval):
+    """Throttled ``SESSION.get``, retried on timeouts, 429 and 5xx gateway errors.
+
+    Raises :class:`GeocoderUnavailable` if the server still refuses (or can't be
+    reached) after :data:`MAX_RETRIES` backoffs.
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        _throttle(interval)
+        try:
+            r = SESSION.get(url, params=params, timeout=20)
+        except (requests.Timeout, requests.ConnectionError):
+            r = None
+        if r is not None and r.status_code not in RETRY_STATUS:
+            return r
+        if attempt < MAX_RETRIES:
+            retry_after = r.headers.get("Retry-After", "") if r is not None else ""
+            _backoff(min(float(retry_after), 60.0) if retry_after.isdigit()
+                     else BACKOFF_BASE ** attempt)
+    raise GeocoderUnavailable(f"{url} unavailable after {MAX_RETRIES} retries")
+
+def _nominatim_components(js):
+    comp = js[0].get("address", {})
+    d = comp.get("state_district") or comp.get("district") or comp.get("county") or comp.get("state")
+    t = (comp.get("suburb") or comp.get("neighbourhood") or comp.get("city_district") or
+         comp.get("municipality") or comp.get("borough") or comp.get("town") or
+         comp.get("city") or comp.get("village") or comp.get("police"))
+    return d, t
+
+def _photon_components(js):
+    prop = js["features"][0].get("properties", {})
+    d = prop.get("county") or prop.get("state")
+    t = prop.get("district") or prop.get("locality") or prop.get("city") or prop.get("name")
+    return d, t
+
+def nominatim_lookup(address, url=NOMINATIM_URL, endpoint_type="public"):
+    """(district, thana) for ``address`` from OSM, or ``(None, None)`` if nothing matched.
+
+    Raises :class:`GeocoderUnavailable` when the endpoint can't answer at all.
+    Only the ``public`` endpoint is throttled to the OSM usage policy; a
+    ``self-hosted`` Nominatim or a ``photon`` server is queried at full speed.
+    """
+    interval = NOMINATIM_INTERVAL if endpoint_type == "public" else 0
     raw = (address or "").strip()
     attempts = [
         raw,
         bangla_normalize_text(raw),
         f"{raw}, Bangladesh" if "bangladesh" not in raw.lower() else raw,
-        re.sub(r"\s+", " ", raw.replace(",", " ")) + ", Bangladesh",
+        _WS.sub(" ", raw.replace(",", " ")) + ", Bangladesh",
     ]
     for q in attempts:
         if not q or len(q.strip()) < 3:
             continue
         try:
-            r = requests.get(
-                base,
-                params={"q": q, "format": "json", "addressdetails": 1, "countrycodes": "bd", "limit": 1},
-                headers=headers, timeout=20
-            )
+            if endpoint_type == "photon":
+                params = {"q": q, "limit": 1, "lang": "en", "bbox": BD_BBOX}
+            else:
+                params = {"q": q, "format": "json", "addressdetails": 1, "countrycodes": "bd", "limit": 1}
+            r = _fetch(url, params, interval)
             if r.status_code != 200:
-                time.sleep(1.1); continue
-            js = r.json()
-            if not js:
-                time.sleep(1.1); continue
-            comp = js[0].get("address", {})
-            d = comp.get("state_district") or comp.get("district") or comp.get("county") or comp.get("state")
-            t = (comp.get("suburb") or comp.get("neighbourhood") or comp.get("city_district") or
-                 comp.get("municipality") or comp.get("borough") or comp.get("town") or
-                 comp.get("city") or comp.get("village") or comp.get("police"))
+                continue
+            # decode the raw bytes directly; skips requests' charset sniffing
+            try:
+                js = json.loads(r.content)
+            except ValueError:
+                continue
+            if not (js.get("features") if endpoint_type == "photon" else js):
+                continue
+            d, t = _photon_components(js) if endpoint_type == "photon" else _nominatim_components(js)
             return to_english(d), to_english(t)
+        except GeocoderUnavailable:
+            raise  # more query variants would only add load
         except Exception:
-            time.sleep(1.1); continue
+            continue
     return None, None
 
 # ---------------- Enrichment ----------------
 def offline_enrich(addr_norm, offline_map):
-    d = guess_district_from_text(addr_norm)
-    a = guess_area(addr_norm)
+    d, a = classify(addr_norm)
     district_out = to_english(d) if d else "Not found"
-    thana_out    = to_english(a.replace(" r a"," R/A")) if a else "Not found"
-
-    toks = addr_norm.replace(",", " ").split()
-    grams = toks + [" ".join(toks[i:i+2]) for i in range(len(toks)-1)]
-    for g in grams:
-        g_norm = normalize(g)
-        if g_norm in offline_map:
-            if thana_out == "Not found": thana_out = to_english(g_norm)
-            if district_out == "Not found": district_out = to_english(offline_map[g_norm])
+    thana_out    = AREA_LABELS[a] if a else "Not found"
+
+    if district_out != "Not found" and thana_out != "Not found":
+        return district_out, thana_out
+
+    # same memoized grams the guessers used; already normalized
+    for g in _scan_tokens(addr_norm)[1]:
+        di = offline_map.get(g)
+        if di is not None:
+            if thana_out == "Not found": thana_out = to_english(g)
+            if district_out == "Not found": district_out = to_english(di)
             break
     return district_out, thana_out
 
-def online_enrich(address, cache):
+# lookups currently on the wire, so concurrent callers (pool workers, parallel
+# Streamlit sessions) asking for the same address share one request
+_inflight: dict[tuple[str, str], Future] = {}
+_inflight_lock = threading.Lock()
+
+def online_enrich(address, cache, url=NOMINATIM_URL, endpoint_type="public"):
+    """Cached (district, thana) for ``address``; misses are looked up and stored.
+
+    A :class:`GeocoderUnavailable` from the lookup propagates (to concurrent
+    waiters too) and leaves the cache untouched, so an outage isn't remembered
+    as "Not found".
+    """
     if address in cache:
         d, t = cache[address]
         return to_english(d), to_english(t)
-    d, t = nominatim_lookup(address)
-    time.sleep(1.1)  # respect OSM
-    cache[address] = (d or "Not found", t or "Not found")
-    return cache[address]
-
-NUMERIC_ONLY = re.compile(r"^\d+([/.,-]\d+)*$")
+    key = (url, address)
+    with _inflight_lock:
+        fut = _inflight.get(key)
+        owner = fut is None
+        if owner:
+            fut = _inflight[key] = Future()
+    if not owner:
+        return fut.result()
+    try:
+        d, t = nominatim_lookup(address, url=url, endpoint_type=endpoint_type)
+        result = (d or "Not found", t or "Not found")
+        cache[address] = result
+        fut.set_result(result)
+        return result
+    except BaseException as e:
+        fut.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            del _inflight[key]
 
 def run(input_xlsx, output_xlsx, address_col=None, mode="auto",
         gazetteer_csv=None, cache_path=None, sheet_index=0,
-        retry_online_notfound=True):
-    xls = pd.ExcelFile(input_xlsx)
-    df = pd.read_excel(xls, xls.sheet_names[sheet_index])
+        retry_online_notfound=True, online_workers=None,
+        nominatim_url=NOMINATIM_URL, endpoint_type="public", keep_original=False,
+        on_progress=None):
+    """Enrich ``input_xlsx`` with District/Thana columns and write ``output_xlsx``.
+
+    ``input_xlsx`` may be a path or a binary file-like object (e.g. an upload buffer).
+
+    ``on_progress(fraction, message)``, if given, is called from the calling
+    thread as the run advances, mostly while online lookups complete.
 
-    # detect address column
+    Returns how many addresses went without an online lookup because the endpoint
+    was unreachable (0 on a normal run); those rows are "Not found" this time only.
+    """
+    report = on_progress or (lambda fraction, message: None)
+    check_endpoint(nominatim_url, endpoint_type)
+    if online_workers is None:
+        # the public endpoint is rate-limited anyway; a private one can take a full pool
+        online_workers = 2 if endpoint_type == "public" else POOL_SIZE
+    df = pd.read_excel(input_xlsx, sheet_name=sheet_index, engine="calamine")
+
+    # detect address column ("addr" also covers "address"); else the first column
     if address_col is None:
-        for col in df.columns:
-            c = str(col).strip().lower()
-            if c in {"address"} or "address" in c or "addr" in c or "ঠিকানা" in c:
-                address_col = col; break
-        if address_col is None: address_col = df.columns[0]
+        address_col = next((col for col in df.columns
+                            if "addr" in (c := str(col).strip().lower()) or "ঠিকানা" in c),
+                           df.columns[0])
 
     offline_map = make_offline_index(load_csv_gazetteer(gazetteer_csv)) if gazetteer_csv else make_offline_index([])
     cache = load_cache(cache_path) if cache_path else {}
 
-    enriched = df.copy()
-    if "District" not in enriched.columns: enriched["District"] = ""
-    if "Thana" not in enriched.columns: enriched["Thana"] = ""
+    enriched = df.copy(deep=False)  # copy-on-write: new columns never touch df
+    preexisting = {c for c in ("District", "Thana") if c in enriched.columns}
+
+    raw = enriched[address_col]
+    addrs = raw.astype(str).where(raw.notna(), "")
 
-    for i, raw in enriched[address_col].items():
-        addr = "" if pd.isna(raw) else str(raw)
-        addr_norm = normalize(addr)
+    # pass 1: offline, once per distinct address; collect the ones that still need OSM
+    report(0.0, "Matching addresses offline…")
+    uniques = addrs.drop_duplicates()
+    norms = normalize_series(uniques) if mode != "online" else uniques
+    results = {}
+    by_norm = {}      # spelling variants of one address normalize alike; match them once
+    online_todo = {}  # insertion-ordered set
+    for addr, addr_norm in zip(uniques, norms):
         district_out, thana_out = "Not found", "Not found"
+        if not addr.strip():
+            # blank cell: nothing to match, and OSM would only be asked for ", Bangladesh"
+            results[addr] = (district_out, thana_out)
+            continue
+        # every key has a letter, so phone numbers/IDs (or Bangla, which normalize()
+        # strips) can't match offline; they may still go online below
+        if mode != "online" and _HAS_LETTER.search(addr_norm):
+            hit = by_norm.get(addr_norm)
+            if hit is None:
+                hit = by_norm[addr_norm] = offline_enrich(addr_norm, offline_map)
+            district_out, thana_out = hit
+        if mode == "online" or ((mode == "auto" or retry_online_notfound) and
+                                (district_out == "Not found" or thana_out == "Not found")):
+            online_todo[addr] = None
+        results[addr] = (district_out, thana_out)
 
-        if mode == "offline":
-            district_out, thana_out = offline_enrich(addr_norm, offline_map)
-        elif mode == "online":
-            district_out, thana_out = online_enrich(addr, cache)
-        else:  # auto
-            d1, t1 = offline_enrich(addr_norm, offline_map)
-            district_out, thana_out = d1, t1
-            if district_out == "Not found" or thana_out == "Not found":
-                d2, t2 = online_enrich(addr, cache)
-                if district_out == "Not found": district_out = d2
-                if thana_out == "Not found": thana_out = t2
-
-        if retry_online_notfound and (district_out == "Not found" or thana_out == "Not found") and mode != "online":
-            d3, t3 = online_enrich(addr, cache)
-            if district_out == "Not found" and d3: district_out = d3
-            if thana_out == "Not found" and t3: thana_out = t3
+    # pass 2: online lookups run concurrently; _throttle() keeps the global rate
+    skipped = []  # appended from pool workers; list.append is atomic
+    if online_todo:
+        lookup = partial(online_enrich, cache=cache, url=nominatim_url, endpoint_type=endpoint_type)
+        # cached answers are resolved inline; only real network work goes to the pool
+        pending = [a for a in online_todo if a not in cache]
+        online = {a: lookup(a) for a in online_todo.keys() - set(pending)}
+        down = threading.Event()
+
+        def lookup_or_skip(addr):
+            # once the endpoint has run out of retries, don't make every other
+            # address sit through the same backoff; they stay "Not found" for this run only
+            if not down.is_set():
+                try:
+                    return lookup(addr)
+                except GeocoderUnavailable:
+                    down.set()
+            skipped.append(addr)
+            return None, None
+
+        if pending:
+            n, last = len(pending), -1
+            report(0.0, f"Looking up {n:,} addresses online…")
+            with ThreadPoolExecutor(max_workers=min(online_workers, len(pending))) as ex:
+                for k, (addr, res) in enumerate(zip(pending, ex.map(lookup_or_skip, pending)), 1):
+                    online[addr] = res
+                    if (pct := 100 * k // n) != last:  # at most ~100 updates
+                        last = pct
+                        report(k / n, f"Online lookups: {k:,}/{n:,}")
+
+    for addr, (district_out, thana_out) in results.items():
+        if addr in online_todo:
+            d2, t2 = online[addr]
+            if district_out == "Not found" and d2: district_out = d2
+            if thana_out == "Not found" and t2: thana_out = t2
 
         # force English
         district_out = to_english(district_out)
@@ -288,31 +807,65 @@ def run(input_xlsx, output_xlsx, address_col=None, mode="auto",
         # numeric-only cleanup
         if NUMERIC_ONLY.fullmatch(str(thana_out).strip()):   thana_out = "Not found"
         if NUMERIC_ONLY.fullmatch(str(district_out).strip()): district_out = "Not found"
+        results[addr] = (district_out, thana_out)
 
-        if not str(enriched.at[i, "District"]).strip():
-            enriched.at[i, "District"] = district_out
-        if not str(enriched.at[i, "Thana"]).strip():
-            enriched.at[i, "Thana"] = thana_out
+    # one column assignment each; an input that already had the column keeps its
+    # non-blank cells, otherwise the whole column is written straight away
+    for col, pos in (("District", 0), ("Thana", 1)):
+        found = addrs.map({a: r[pos] for a, r in results.items()})
+        if col in preexisting:
+            blank = enriched[col].astype(str).str.strip() == ""
+            found = enriched[col].where(~blank, found)
+        enriched[col] = found
 
-    with pd.ExcelWriter(output_xlsx, engine="xlsxwriter") as w:
-        df.to_excel(w, sheet_name="Original", index=False)
-        enriched.to_excel(w, sheet_name="Enriched", index=False)
+    report(1.0, "Writing output…")
+    if str(output_xlsx).lower().endswith(".csv"):
+        # far cheaper than xlsx for big sheets; the BOM lets Excel open Bangla text correctly.
+        # A CSV holds one table, so there is no Original copy here.
+        enriched.to_csv(output_xlsx, index=False, encoding="utf-8-sig")
+    else:
+        # strings_to_urls=False skips xlsxwriter's URL regex on every string cell
+        with pd.ExcelWriter(output_xlsx, engine="xlsxwriter",
+                            engine_kwargs={"options": {"strings_to_urls": False}}) as w:
+            if keep_original:
+                df.to_excel(w, sheet_name="Original", index=False)
+            enriched.to_excel(w, sheet_name="Enriched", index=False)
 
-    if cache_path: save_cache(cache_path, cache)
+    if cache_path: cache.close()
+    return len(skipped)
 
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
     ap.add_argument("--input", required=True)
-    ap.add_argument("--output", required=True)
+    ap.add_argument("--output", required=True, help=".xlsx, or .csv for a faster plain-text write")
     ap.add_argument("--address-col", default=None)
     ap.add_argument("--mode", choices=["auto","offline","online"], default="auto")
     ap.add_argument("--csv-gazetteer", default="bangladesh_thana_district.csv")
-    ap.add_argument("--cache", default="cache_geocode.csv")
+    ap.add_argument("--cache", default="cache_geocode.db")
     ap.add_argument("--sheet-index", type=int, default=0)
     ap.add_argument("--retry-online-notfound", action="store_true")
+    ap.add_argument("--online-workers", type=int, default=None,
+                    help="concurrent lookups (default: 2 for public, CPU count otherwise)")
+    ap.add_argument("--nominatim-url", default=NOMINATIM_URL)
+    ap.add_argument("--endpoint-type", choices=ENDPOINT_TYPES, default="public")
+    ap.add_argument("--keep-original", action="store_true",
+                    help="also write the untouched input as an 'Original' sheet")
+    ap.add_argument("--verbose", action="store_true", help="print memoization hit rates after the run")
+    ap.add_argument("--invalidate-prefix", action="append", default=[],
+                    help="drop cached lookups whose address starts with this text (repeatable)")
     args = ap.parse_args()
+    try:
+        check_endpoint(args.nominatim_url, args.endpoint_type)
+    except ValueError as e:
+        ap.error(f"{e} (pass --nominatim-url)")
 
-    run(
+    if args.invalidate_prefix:
+        cache = load_cache(args.cache)
+        for prefix in args.invalidate_prefix:
+            cache.invalidate_prefix(prefix)
+        cache.close()
+
+    skipped = run(
         input_xlsx=args.input,
         output_xlsx=args.output,
         address_col=args.address_col,
@@ -321,4 +874,15 @@ if __name__ == "__main__":
         cache_path=args.cache,
         sheet_index=args.sheet_index,
         retry_online_notfound=bool(args.retry_online_notfound or True),
+        online_workers=args.online_workers,
+        nominatim_url=args.nominatim_url,
+        endpoint_type=args.endpoint_type,
+        keep_original=args.keep_original,
     )
+    if skipped:
+        print(f"warning: {args.nominatim_url} unreachable; {skipped:,} online lookups were skipped "
+              "and nothing was cached for them", file=sys.stderr)
+
+    if args.verbose:
+        for fn in (normalize, bangla_normalize_text, guess_area, classify):
+            print(f"{fn.__name__}: {fn.cache_info()}")
@@ -1,7 +1,10 @@
-import os, io, re
+import os, io, uuid, threading
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
 import streamlit as st
-from address_enricher import run as enrich_run
+from address_enricher import (run as enrich_run, read_cache_pairs, resolve_cache_path,
+                              clean_gazetteer_frame, starter_gazetteer)
 
 st.set_page_config(page_title="BD Address Enricher", page_icon="🗺️", layout="wide")
 
@@ -17,6 +20,76 @@ Offline → Online fallback • Learns from cache • Merge multiple CSV sources
 """, unsafe_allow_html=True)
 st.markdown("<hr>", unsafe_allow_html=True)
 
+GAZETTEER_PATH = os.path.join("tmp","bangladesh_thana_district.csv")
+
+def write_atomic(path: str, write) -> str:
+    """Call ``write(tmp_path)``, then rename the result over ``path`` in one step.
+
+    The enricher (or another session) sees the old file or the new one, never a
+    half-written one.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    return path
+
+def same_bytes(data, path: str) -> bool:
+    """True if the file at ``path`` holds exactly ``data``."""
+    data = memoryview(data).cast("B")
+    try:
+        if os.path.getsize(path) != data.nbytes:
+            return False
+        # compare in chunks against slices of the view: no second full copy in memory
+        with open(path, "rb") as f:
+            for i in range(0, data.nbytes, 1 << 20):
+                if f.read(1 << 20) != data[i:i + (1 << 20)]:
+                    return False
+        return True
+    except OSError:
+        return False
+
+def write_if_changed(data, path: str) -> str:
+    """Write ``data`` to ``path`` unless the same bytes are already there.
+
+    Leaving an unchanged file alone keeps its mtime, which the enricher's gazetteer
+    and cache loaders key their reuse on, so repeat clicks don't re-parse it.
+    """
+    if same_bytes(data, path):
+        return path
+    def write(tmp):
+        with open(tmp, "wb") as f:
+            f.write(data)
+    return write_atomic(path, write)
+
+def save_upload(up, path: str) -> str:
+    """Write an uploaded file to ``path`` (see :func:`write_if_changed`)."""
+    return write_if_changed(up.getbuffer(), path)
+
+def _stamp(path):
+    """``(mtime_ns, size)`` of ``path``, or None if it doesn't exist."""
+    try:
+        info = os.stat(path)
+    except (OSError, TypeError):
+        return None
+    return info.st_mtime_ns, info.st_size
+
+def write_gazetteer_csv(df: pd.DataFrame, path: str) -> str:
+    """Write a ``thana,district`` frame as CSV with pyarrow's columnar writer.
+
+    Many times faster than ``to_csv`` on merged gazetteers; fields come out quoted,
+    which every reader here (pandas, the csv module, Excel) takes as-is.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    return write_atomic(path, lambda tmp: pacsv.write_csv(table, tmp))
+
 # ----------------- Upload section -----------------
 uploaded = st.file_uploader("📤 Upload Excel (.xlsx) with an **Address** column", type=["xlsx"])
 c1, c2, c3 = st.columns(3)
@@ -24,6 +97,12 @@ mode = c1.selectbox("Mode", ["auto","offline","online"], 0,
                     help="auto = Offline first, then fill missing via Online")
 address_col = c2.text_input("Address column name (optional; auto-detects)", "")
 sheet_index = c3.number_input("Sheet index (0-based)", min_value=0, value=0, step=1)
+c4, c5 = st.columns(2)
+out_format = c4.radio("Output format", ["Excel (.xlsx)", "CSV (.csv)"], horizontal=True,
+                      help="CSV writes much faster on large files and opens in Excel too")
+keep_original = c5.checkbox("Include an 'Original' sheet in the output", value=False,
+                            help="Off = only the Enriched sheet (smaller file, faster write)",
+                            disabled=out_format.startswith("CSV"))
 
 # =============================================================================
 # Gazetteer & Cache toolbox
@@ -38,119 +117,93 @@ with st.expander("🗂 Gazetteer & Cache (build • merge • grow)"):
     cache_csv = st.file_uploader("Upload existing cache_geocode.csv (optional)", type=["csv"])
     retry_flag = st.checkbox("Retry online for rows that remain Not found", value=True)
 
-    NUMERIC = re.compile(r"^\s*\d+([/.,-]\d+)*\s*$")
-
-    def _clean_df(df: pd.DataFrame) -> pd.DataFrame:
-        cols = {c.lower(): c for c in df.columns}
-        th = cols.get("thana") or cols.get("upazila") or cols.get("area") or list(df.columns)[0]
-        di = cols.get("district") or list(df.columns)[1]
-        part = df[[th, di]].rename(columns={th: "thana", di: "district"})
-        part["thana"] = part["thana"].astype(str).str.strip().str.title()
-        part["district"] = part["district"].astype(str).str.strip().str.title()
-        # FIX: no .str.eq(); use lowercase compare
-        part = part[
-            (part["thana"] != "") & (part["district"] != "") &
-            (~part["thana"].str.match(NUMERIC)) & (~part["district"].str.match(NUMERIC)) &
-            (part["thana"].str.strip().str.lower() != "not found") &
-            (part["district"].str.strip().str.lower() != "not found")
-        ]
-        return part
+    @st.cache_data(show_spinner=False, max_entries=32)
+    def _parse_gazetteer(data: bytes) -> pd.DataFrame:
+        # keyed on the file bytes: re-merging or reprocessing the same uploads skips the parse.
+        # pyarrow ships with streamlit, so its multi-threaded reader is always there in the app
+        df = pd.read_csv(io.BytesIO(data), encoding="utf-8", dtype=str, on_bad_lines="skip", engine="pyarrow")
+        # dedupe per file while cached, so the merge only concatenates unique pairs
+        return clean_gazetteer_frame(df).drop_duplicates(ignore_index=True)
 
     def merge_gazetteers(file_list) -> str | None:
         if not file_list:
             return None
-        frames = []
-        for up in file_list:
-            df = pd.read_csv(io.BytesIO(up.read()), encoding="utf-8", engine="python", on_bad_lines="skip")
-            frames.append(_clean_df(df))
+        frames = [_parse_gazetteer(up.getvalue()) for up in file_list]
         if not frames:
             return None
         out = (pd.concat(frames, ignore_index=True)
                .drop_duplicates()
                .sort_values(["district","thana"])
                .reset_index(drop=True))
-        os.makedirs("tmp", exist_ok=True)
-        p = os.path.join("tmp","bangladesh_thana_district.csv")
-        out.to_csv(p, index=False, encoding="utf-8")
+        write_gazetteer_csv(out, GAZETTEER_PATH)
         st.success(f"✅ Merged gazetteer: {len(out):,} rows")
-        return p
-
-    def build_starter() -> str:
-        data = {
-            "Dhaka": ["Gulshan","Banani","Badda","Uttara","Khilkhet","Mohammadpur","Tejgaon","Dhanmondi",
-                      "Rampura","Jatrabari","Wari","Motijheel","Kafrul","Cantonment","Baridhara",
-                      "Bashundhara R/A","Bosila","Khilgaon"],
-            "Gazipur": ["Tongi","Joydebpur","Kaliakair","Kaliganj","Sreepur"],
-            "Narayanganj": ["Sadar","Sonargaon","Rupganj","Araihazar","Siddhirganj","Bandar","Fatulla"],
-            "Chattogram": ["Kotwali","Pahartali","Double Mooring","Halishahar","Patenga","Bakalia",
-                           "Panchlaish","Chandgaon","Bayazid","Akbar Shah"],
-            "Sylhet": ["Subidbazar","South Surma","Kotwali Sylhet","Moglabazar","Ambarkhana","Osmani Nagar","Beanibazar"],
-            "Comilla": ["Adarsa Sadar","Kotwali Comilla","Daudkandi","Chandina","Homna","Burichang"],
-            "Khulna": ["Sonadanga","Daulatpur","Khalishpur","Khulna Kotwali","Rupsha"],
-            "Rajshahi": ["Boalia","Rajpara","Motihar","Shah Makhdum","Paba"],
-            "Barishal": ["Barishal Kotwali","Bakerganj","Banaripara","Gournadi"],
-            "Mymensingh": ["Sadar","Trishal","Ishwarganj","Muktagacha"],
-            "Rangpur": ["Gangachara","Pirganj","Kaunia","Mithapukur"],
-            "Noakhali": ["Sadar","Begumganj","Senbagh","Chatkhil"],
-            "Feni": ["Sadar","Sonagazi","Chhagalnaiya","Parshuram"],
-            "Bogura": ["Sadar","Sherpur","Gabtali","Shajahanpur"],
-            "Kushtia": ["Sadar","Mirpur","Bheramara","Khoksa"],
-        }
-        rows = [{"thana":t,"district":d} for d,ts in data.items() for t in ts]
-        df = pd.DataFrame(rows).sort_values(["district","thana"]).reset_index(drop=True)
-        os.makedirs("tmp", exist_ok=True)
-        p = os.path.join("tmp","bangladesh_thana_district.csv")
-        df.to_csv(p, index=False, encoding="utf-8")
-        st.success(f"✅ Starter gazetteer built: {len(df):,} rows")
-        return p
+        return GAZETTEER_PATH
+
+    @st.cache_data(show_spinner=False)
+    def _starter_csv() -> bytes:
+        return starter_gazetteer().to_csv(index=False).encode("utf-8")
+
+    def build_starter() -> str | None:
+        data = _starter_csv()
+        # any other gazetteer (merged, grown, a curated list) is someone's work; don't drop it on one click
+        if (os.path.exists(GAZETTEER_PATH) and not same_bytes(data, GAZETTEER_PATH)
+                and not st.session_state.get("confirm_starter")):
+            st.session_state["confirm_starter"] = True
+            st.warning("A different gazetteer is already built. "
+                       "Click **Build Starter Gazetteer** again to replace it.")
+            return None
+        st.session_state.pop("confirm_starter", None)
+        write_if_changed(data, GAZETTEER_PATH)
+        st.success(f"✅ Starter gazetteer built: {len(starter_gazetteer()):,} rows")
+        return GAZETTEER_PATH
 
     cA, cB, cC = st.columns([1,1,1])
     if cA.button("🧩 Build Starter Gazetteer"):
         build_starter()
+    else:
+        st.session_state.pop("confirm_starter", None)  # confirmation only counts right away
     if cB.button("➕ Merge Uploaded Gazetteers"):
         merge_gazetteers(gaz_files)
 
+    def grow_from_cache() -> None:
+        cache_path = resolve_cache_path("cache_geocode.db")
+        if cache_csv is not None:
+            cache_path = save_upload(cache_csv, os.path.join("tmp","cache_geocode.csv"))
+        # opening a missing .db would create an empty one; an empty cache is caught by pairs.empty below
+        if not os.path.exists(cache_path):
+            st.warning("No usable cache found — nothing to grow.")
+            return
+        dfc = read_cache_pairs(cache_path)
+        cols = {c.lower(): c for c in dfc.columns}
+        dcol = cols.get("district")
+        tcol = cols.get("thana")
+        if not (dcol and tcol):
+            st.error("Cache must have columns: address,district,thana")
+            return
+        pairs = clean_gazetteer_frame(dfc[[tcol,dcol]].dropna()).drop_duplicates()
+        if pairs.empty:
+            st.warning("The cache holds no usable thana/district pairs yet.")
+            return
+        base_path = GAZETTEER_PATH
+        if os.path.exists(base_path):
+            base = pd.read_csv(base_path, encoding="utf-8", dtype=str, engine="pyarrow")
+            merged = pd.concat([base, pairs], ignore_index=True).drop_duplicates()
+            # nothing new from the cache: the file on disk is already sorted and complete
+            if len(merged) > len(base):
+                write_gazetteer_csv(merged.sort_values(["district","thana"]), base_path)
+        else:
+            # sorted once, on whichever frame actually gets written
+            write_gazetteer_csv(pairs.sort_values(["district","thana"]), base_path)
+        with open(base_path,"rb") as f:
+            st.download_button("⬇️ Download updated bangladesh_thana_district.csv", f,
+                               file_name="bangladesh_thana_district.csv")
+        st.success(f"✅ Added {len(pairs)} unique pairs from cache.")
+
     # ---- Grow from cache (FIXED filters) ----
     with cC:
         if st.button("🔁 Grow Gazetteer from Cache"):
             try:
-                cache_path = "cache_geocode.csv"
-                if cache_csv is not None:
-                    os.makedirs("tmp", exist_ok=True)
-                    cache_path = os.path.join("tmp","cache_geocode.csv")
-                    with open(cache_path,"wb") as f:
-                        f.write(cache_csv.getbuffer())
-                dfc = pd.read_csv(cache_path, encoding="utf-8", engine="python")
-                cols = {c.lower(): c for c in dfc.columns}
-                dcol = cols.get("district")
-                tcol = cols.get("thana")
-                if not (dcol and tcol):
-                    st.error("Cache must have columns: address,district,thana")
-                else:
-                    pairs = (dfc[[dcol,tcol]].rename(columns={dcol:"district",tcol:"thana"})
-                             .dropna())
-                    pairs["district"] = pairs["district"].astype(str).str.strip().str.title()
-                    pairs["thana"]    = pairs["thana"].astype(str).str.strip().str.title()
-                    # FIX: no .str.eq(); use lowercase compare
-                    pairs = pairs[
-                        (pairs["district"] != "") & (pairs["thana"] != "") &
-                        (~pairs["district"].str.match(NUMERIC)) & (~pairs["thana"].str.match(NUMERIC)) &
-                        (pairs["district"].str.strip().str.lower() != "not found") &
-                        (pairs["thana"].str.strip().str.lower() != "not found")
-                    ].drop_duplicates().sort_values(["district","thana"])
-                    base_path = os.path.join("tmp","bangladesh_thana_district.csv")
-                    if os.path.exists(base_path):
-                        base = pd.read_csv(base_path, encoding="utf-8", engine="python")
-                        base = (pd.concat([base, pairs], ignore_index=True)
-                                .drop_duplicates()
-                                .sort_values(["district","thana"]))
-                    else:
-                        base = pairs
-                    base.to_csv(base_path, index=False, encoding="utf-8")
-                    with open(base_path,"rb") as f:
-                        st.download_button("⬇️ Download updated bangladesh_thana_district.csv", f,
-                                           file_name="bangladesh_thana_district.csv")
-                    st.success(f"✅ Added {len(pairs)} unique pairs from cache.")
+                grow_from_cache()
             except Exception as e:
                 st.error(f"Failed: {e}")
 
@@ -163,42 +216,69 @@ if st.button("⚙️ Process & Download", type="primary"):
     if not uploaded:
         st.error("Please upload an Excel (.xlsx) file first.")
     else:
+        bar = st.progress(0.0, text="Starting…")
         with st.spinner("Processing your file... ⏳"):
             os.makedirs("tmp", exist_ok=True)
-            in_path = os.path.join("tmp","input.xlsx")
-            with open(in_path,"wb") as f:
-                f.write(uploaded.getbuffer())
 
             # Choose gazetteer priority: merged/starter > uploaded single > nothing
             gaz_path = None
-            built = os.path.join("tmp","bangladesh_thana_district.csv")
-            if os.path.exists(built):
-                gaz_path = built
+            if os.path.exists(GAZETTEER_PATH):
+                gaz_path = GAZETTEER_PATH
             elif gaz_files:
                 gaz_path = merge_gazetteers(gaz_files)
 
             # Cache path
-            cache_path = "cache_geocode.csv"
+            cache_path = "cache_geocode.db"
             if cache_csv is not None:
-                cache_path = os.path.join("tmp","cache_geocode.csv")
-                with open(cache_path,"wb") as f:
-                    f.write(cache_csv.getbuffer())
-
-            out_path = os.path.join("tmp","output.xlsx")
-            enrich_run(
-                input_xlsx=in_path,
-                output_xlsx=out_path,
-                address_col=(address_col if address_col.strip() else None),
-                mode=mode,
-                gazetteer_csv=gaz_path,
-                cache_path=cache_path,
-                sheet_index=int(sheet_index),
-                retry_online_notfound=bool(retry_flag),
-            )
-
-        with open(out_path,"rb") as f:
-            st.download_button("⬇️ Download Enriched Excel", f, file_name="address_enriched.xlsx")
-        st.success("✅ Done! Offline + Online enrichment completed.")
+                cache_path = save_upload(cache_csv, os.path.join("tmp","cache_geocode.csv"))
+
+            ext = ".csv" if out_format.startswith("CSV") else ".xlsx"
+            # one output file per browser session: the download is read lazily, so a
+            # shared path would serve whatever another session wrote in the meantime
+            session_tag = st.session_state.setdefault("session_tag", uuid.uuid4().hex)
+            out_path = os.path.join("tmp", f"output-{session_tag}{ext}")
+            # same upload, gazetteer, cache and options as the last run: reuse its output.
+            # Unchanged files keep their mtime (see write_if_changed), so stamps are enough.
+            def run_key():
+                stamps = tuple(_stamp(p) for p in (gaz_path, cache_path, cache_path + "-wal", out_path))
+                return (uploaded.file_id, uploaded.size, stamps, address_col.strip(), mode,
+                        gaz_path, cache_path, int(sheet_index), bool(retry_flag), bool(keep_original), ext)
+            skipped = 0
+            if st.session_state.get("last_run") != run_key():
+                # the workbook is read straight from the upload's buffer, no copy on disk first
+                uploaded.seek(0)
+                skipped = enrich_run(
+                    input_xlsx=uploaded,
+                    output_xlsx=out_path,
+                    address_col=(address_col if address_col.strip() else None),
+                    mode=mode,
+                    gazetteer_csv=gaz_path,
+                    cache_path=cache_path,
+                    sheet_index=int(sheet_index),
+                    retry_online_notfound=bool(retry_flag),
+                    keep_original=bool(keep_original),
+                    on_progress=lambda frac, msg: bar.progress(frac, text=msg),
+                )
+                # keyed on the stamps *after* the run: its own cache writes shouldn't force a redo.
+                # A run that skipped lookups isn't reusable: the next click should retry them.
+                if skipped:
+                    st.session_state.pop("last_run", None)
+                else:
+                    st.session_state["last_run"] = run_key()
+            bar.progress(1.0, text="Done")
+
+        def read_output() -> bytes:
+            # only called when the button is clicked, so the output isn't held in memory until then
+            with open(out_path, "rb") as f:
+                return f.read()
+        st.download_button("⬇️ Download Enriched " + ("CSV" if ext == ".csv" else "Excel"), read_output,
+                           file_name="address_enriched" + ext)
+        if skipped:
+            st.warning(f"⚠️ The geocoder was unreachable, so {skipped:,} addresses were not looked up "
+                       "online and stay \"Not found\" in this file. Nothing was cached for them; "
+                       "process again later to retry.")
+        else:
+            st.success("✅ Done! Offline + Online enrichment completed.")
 
 # ----------------- Footer -----------------
 st.markdown("<hr>", unsafe_allow_html=True)